@@ -20,37 +20,51 @@ The script assumes that the entire image corresponds to a specific geographic ex
 - Update these values to match the geographic area represented by your image.
 
 Dependencies:
- - OpenCV (cv2): For image processing and graphical interface.
+ - OpenCV (cv2): For image processing, contour detection and graphical interface.
  - NumPy: For numerical operations.
- - scikit-image (measure): For contour detection.
- - pathlib: For file handling.
+ - matplotlib: For colormap matching and 3D surface plots.
+ - Numba (optional): JIT-compiled color mask kernel.
 
 Output:
  - Extracted contours are saved as a KML file (`picked_contours.kml`) with geo-referenced coordinates.
 
 """
 
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-from skimage import measure
-from sklearn.cluster import KMeans
-from matplotlib import cm
-from scipy.spatial import distance
+from matplotlib import colormaps
 from matplotlib import pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; color_mask falls back to NumPy
+    njit = None
+
 # globals for mouse callback
 drawing = False
 ix, iy = -1, -1
 bbox = None
+prev_rect = None
+last_drag = 0.0
+DRAG_INTERVAL = 1 / 60  # cap rubber-band redraws at ~60 Hz
 target_rgb = None
 tol = 30
+# "box": per-channel |c - target| <= tol (cv2.inRange); "l2": Euclidean;
+# "lab": per-channel box in CIELAB, closer to perceived color difference
+metric = "box"
+min_perimeter = 8  # px; shorter contours are treated as noise
 
-# load & clone
+# load & clone; img is the display canvas, reused for every redraw
 img = cv2.imread("map.png")
 if img is None:
     raise FileNotFoundError("map.png not found")
 orig = img.copy()
+orig_lab = cv2.cvtColor(orig, cv2.COLOR_BGR2LAB)  # converted once, sliced per ROI
 
 # ✅ Define the function first
 def get_geo_bounds_from_input():
@@ -75,10 +89,14 @@ def show_3d_surface(region):
     Simulate and plot a 3D surface from the intensity of the region.
     """
     gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
-    x = np.arange(gray.shape[1])
-    y = np.arange(gray.shape[0])
+    # plot_surface only draws a 50x50 mesh by default, so there is no need to
+    # build the meshgrid and float copy at full ROI resolution
+    step = max(1, max(gray.shape) // 256)
+    gray = gray[::step, ::step]
+    x = np.arange(gray.shape[1]) * step
+    y = np.arange(gray.shape[0]) * step
     X, Y = np.meshgrid(x, y)
-    Z = gray.astype(float)
+    Z = gray.astype(np.float32)
 
     fig = plt.figure(figsize=(10, 6))
     ax = fig.add_subplot(111, projection='3d')
@@ -104,99 +122,277 @@ def save_surface_as_kml(region, bbox, filename="surface_3d.kml"):
     Converts the grayscale intensity of a region into a 3D KML surface (extruded points).
     Each pixel is converted to (lon, lat, alt) based on the image bounds and bbox.
     """
-    from pathlib import Path
-
     x1, y1, x2, y2 = bbox
     gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
     h, w = gray.shape
 
-    kml = ['<?xml version="1.0" encoding="UTF-8"?>',
-           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>',
-           '<Style id="redLine"><LineStyle><color>ff0000ff</color><width>1.5</width></LineStyle></Style>']
-
-    for row in range(0, h, 5):  # sample every 5 pixels for manageability
-        coords = []
-        for col in range(0, w, 5):
-            pixel_x = x1 + col
-            pixel_y = y1 + row
-            lon, lat = pixel_to_latlon(pixel_x, pixel_y, orig.shape, geo_bounds)
-            alt = int(gray[row, col]) * 5  # scale altitude
-            coords.append(f"{lon},{lat},{alt}")
-        if coords:
-            kml += [
-                '<Placemark><styleUrl>#redLine</styleUrl>',
-                '<LineString><altitudeMode>relativeToGround</altitudeMode><coordinates>',
-                " ".join(coords),
-                '</coordinates></LineString></Placemark>'
-            ]
-
-    kml.append('</Document></kml>')
-    Path(filename).write_text("\n".join(kml))
+    # sample every 5 pixels for manageability; longitudes are shared by all rows
+    cols = np.arange(0, w, 5)
+    col_lons = pixel_to_latlon(x1 + cols, y1)[0]
+    row_fmt = " ".join(["%r,%r,%d"] * len(cols))  # %r matches f"{float}" output
+    rows = np.empty((len(cols), 3))
+    rows[:, 0] = col_lons
+    # stream one placemark per row straight to disk
+    with open(filename, "w", buffering=1 << 20) as f:
+        f.write(KML_HEADER)
+        f.write('<Style id="redLine"><LineStyle><color>ff0000ff</color><width>1.5</width></LineStyle></Style>\n')
+        for row in range(0, h, 5):
+            rows[:, 1] = pixel_to_latlon(x1, y1 + row)[1]
+            rows[:, 2] = gray[row, ::5]
+            rows[:, 2] *= 5  # scale altitude
+            if len(cols):
+                f.write('<Placemark><styleUrl>#redLine</styleUrl>\n'
+                        '<LineString><altitudeMode>relativeToGround</altitudeMode><coordinates>\n')
+                # one %-format over the whole row instead of an f-string per vertex
+                f.write(row_fmt % tuple(rows.ravel().tolist()))
+                f.write('\n</coordinates></LineString></Placemark>\n')
+        f.write(KML_FOOTER)
     print(f"[✔] 3D Surface exported to: {filename}")
 
 
+# GMT-style colormaps sampled once at import: shape (n_cmaps, 100, 3), RGB in [0, 1]
+GMT_CMAP_NAMES = ['terrain', 'gist_earth', 'ocean', 'viridis', 'nipy_spectral', 'jet']
+CMAP_TABLE = np.stack([colormaps[name](np.linspace(0, 1, 100))[:, :3] for name in GMT_CMAP_NAMES])
+
+def kmeans_colors(pixels, k, iters=50, seed=0):
+    """
+    Small Lloyd's k-means for (N, 3) color samples, seeded with k-means++ so a
+    single run is enough. The assignment step is a single SGEMM via
+    argmin(|c|^2 - 2 x.c) (|x|^2 is constant per row), and the centroid
+    update is a per-channel bincount.
+    """
+    X = np.ascontiguousarray(pixels, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    C = np.empty((k, 3), np.float32)
+    C[0] = X[rng.integers(len(X))]
+    d2 = ((X - C[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = d2.sum()
+        C[i] = X[rng.choice(len(X), p=d2 / total if total > 0 else None)]
+        d2 = np.minimum(d2, ((X - C[i]) ** 2).sum(axis=1))
+    for _ in range(iters):
+        labels = ((C * C).sum(axis=1) - 2 * (X @ C.T)).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)[:, None]
+        sums = np.stack([np.bincount(labels, X[:, c], minlength=k) for c in range(3)], axis=1)
+        # empty clusters keep their previous centre
+        new = np.where(counts > 0, sums / np.maximum(counts, 1), C).astype(np.float32)
+        if np.allclose(new, C, atol=0.5):
+            return new
+        C = new
+    return C
+
 def match_gmt_colormap(region, n_colors=6):
     """
     Detect dominant colors in a region and match to GMT-style colormaps.
     """
     pixels = region.reshape(-1, 3)
-    kmeans = KMeans(n_clusters=n_colors, random_state=0, n_init=10).fit(pixels)
-    dominant_rgb = kmeans.cluster_centers_ / 255.0
-
-    gmt_cmaps = {
-        'terrain': cm.get_cmap('terrain'),
-        'gist_earth': cm.get_cmap('gist_earth'),
-        'ocean': cm.get_cmap('ocean'),
-        'viridis': cm.get_cmap('viridis'),
-        'nipy_spectral': cm.get_cmap('nipy_spectral'),
-        'jet': cm.get_cmap('jet')
-    }
-
-    def sample_cmap(cmap, n=100):
-        return np.array([cmap(i / (n - 1))[:3] for i in range(n)])
-
-    scores = {}
-    for name, cmap in gmt_cmaps.items():
-        cmap_samples = sample_cmap(cmap)
-        dists = distance.cdist(dominant_rgb, cmap_samples, 'euclidean')
-        scores[name] = dists.min(axis=1).mean()
-
-    best = sorted(scores.items(), key=lambda x: x[1])
-    print("[✓] Best matching colormap:", best[0][0])
-    print("Top matches:", [name for name, _ in best[:3]])
-
-def pixel_to_latlon(x, y, img_shape, geo_bounds):
+    if len(pixels) > 10000:  # cluster centres are stable under subsampling
+        idx = np.random.default_rng(0).choice(len(pixels), 10000, replace=False)
+        pixels = pixels[idx]
+    dominant_rgb = kmeans_colors(pixels, n_colors)[:, ::-1] / 255.0  # region is BGR
+
+    # (n_colors, n_cmaps, 100) distances -> nearest sample per color -> mean per cmap
+    dists = np.linalg.norm(dominant_rgb[:, None, None, :] - CMAP_TABLE[None], axis=-1)
+    scores = dists.min(axis=2).mean(axis=0)
+
+    best = [GMT_CMAP_NAMES[i] for i in np.argsort(scores)]
+    print("[✓] Best matching colormap:", best[0])
+    print("Top matches:", best[:3])
+
+def _refresh_geo(img_shape):
+    """
+    Cache the pixel -> lat/lon affine as scalars and lookup tables
+    (image size and bounds are fixed).
+    """
+    global LON0, LAT0, SX, SY, LON_LUT, LAT_LUT
     h, w = img_shape[:2]
-    rx = x / w
-    ry = y / h
-    lon = geo_bounds["west"] + rx * (geo_bounds["east"] - geo_bounds["west"])
-    lat = geo_bounds["north"] - ry * (geo_bounds["north"] - geo_bounds["south"])
-    return lon, lat
+    LON0 = geo_bounds["west"]
+    LAT0 = geo_bounds["north"]
+    SX = (geo_bounds["east"] - geo_bounds["west"]) / w
+    SY = (geo_bounds["north"] - geo_bounds["south"]) / h
+    # per-column / per-row lookup tables for in-image integer pixels
+    LON_LUT = LON0 + np.arange(w) * SX
+    LAT_LUT = LAT0 - np.arange(h) * SY
+
+_refresh_geo(orig.shape)
+
+def pixel_to_latlon(x, y):
+    return LON0 + x * SX, LAT0 - y * SY
+
+def pixels_to_latlon(pts):
+    """
+    Vectorized pixel_to_latlon for an (N, 2) integer array of (x, y) pixels
+    inside the image; a pure table gather.
+    """
+    return LON_LUT[pts[:, 0]], LAT_LUT[pts[:, 1]]
 
 def get_avg_rgb(x, y, sz=5):
     half = sz // 2
     patch = orig[max(0,y-half):min(orig.shape[0],y+half+1),
                  max(0,x-half):min(orig.shape[1],x+half+1)]
-    return tuple(np.mean(patch.reshape(-1,3), axis=0).astype(int))
+    return tuple(int(c) for c in cv2.mean(patch)[:3])
+
+if njit is not None:
+    # explicit signature compiles at import, so the first click doesn't stall
+    @njit("u1[:, :](u1[:, :, :], i4, i4, i4, i4)", parallel=True, fastmath=True, cache=True)
+    def _color_mask_jit(region, t0, t1, t2, tol2):
+        h, w, _ = region.shape
+        out = np.empty((h, w), np.uint8)
+        for i in prange(h):
+            for j in range(w):
+                d0 = np.int32(region[i, j, 0]) - t0
+                d1 = np.int32(region[i, j, 1]) - t1
+                d2 = np.int32(region[i, j, 2]) - t2
+                out[i, j] = 255 if d0 * d0 + d1 * d1 + d2 * d2 <= tol2 else 0
+        return out
+
+    # warm up the parallel runtime on a dummy ROI
+    _color_mask_jit(np.zeros((4, 4, 3), np.uint8), 0, 0, 0, 0)
+else:
+    _color_mask_jit = None
+
+def color_mask(region, target_rgb, tol, metric="box"):
+    """
+    Single-pass color-similarity mask on the uint8 ROI (255 where within tol).
+    The "box" metric is a per-channel range check done by cv2.inRange.
+    The "l2" metric compares squared distances in integers, so no float copy
+    or sqrt; it uses the Numba kernel when numba is installed.
+    """
+    if metric == "box":
+        t = np.int16(target_rgb)
+        lo = np.clip(t - tol, 0, 255).astype(np.uint8)
+        hi = np.clip(t + tol, 0, 255).astype(np.uint8)
+        return cv2.inRange(region, lo, hi)
+    if _color_mask_jit is not None:
+        t0, t1, t2 = (int(c) for c in target_rgb)
+        return _color_mask_jit(region, t0, t1, t2, tol * tol)
+    # one channel plane at a time with in-place narrow integer ops: |diff| fits
+    # int16, its square (<= 255**2) fits uint16, and the sum fits uint32;
+    # no 3-channel diff tensor is materialized
+    d2 = None
+    for c in range(3):
+        d = region[..., c].astype(np.int16)
+        d -= target_rgb[c]
+        d = np.abs(d, out=d).view(np.uint16)
+        d *= d
+        d2 = d.astype(np.uint32) if d2 is None else np.add(d2, d, out=d2)
+    return (d2 <= tol * tol).view(np.uint8) * 255
+
+# pixels covered by a filled cv2.circle of radius 2
+DOT_OFFSETS = [(dy, dx) for dy in range(-2, 3) for dx in range(-2, 3) if abs(dy) + abs(dx) <= 2]
+
+def draw_dots(canvas, pts, color):
+    """
+    Stamp a radius-2 dot at every (x, y) in pts with fancy indexing,
+    instead of one cv2.circle call per point.
+    """
+    h, w = canvas.shape[:2]
+    xs, ys = pts[:, 0], pts[:, 1]
+    for dy, dx in DOT_OFFSETS:
+        canvas[np.clip(ys + dy, 0, h - 1), np.clip(xs + dx, 0, w - 1)] = color
+
+@functools.lru_cache(maxsize=256)
+def text_size(label):
+    """
+    Memoized cv2.getTextSize for the bbox corner labels.
+    """
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0]
+
+def lab_mask(region_lab, target_bgr, tol):
+    """
+    Box-threshold a LAB ROI (a view into orig_lab) around the target color.
+    """
+    t = np.int16(cv2.cvtColor(np.uint8([[target_bgr]]), cv2.COLOR_BGR2LAB)[0, 0])
+    lo = np.clip(t - tol, 0, 255).astype(np.uint8)
+    hi = np.clip(t + tol, 0, 255).astype(np.uint8)
+    return cv2.inRange(region_lab, lo, hi)
+
+# contours of recent extractions, keyed on everything that affects the mask;
+# redraws and re-picks with the same inputs skip clustering, masking and tracing.
+# Bounded FIFO (dicts keep insertion order) to cap memory.
+contour_cache = {}
+CONTOUR_CACHE_SIZE = 16
+kml_key = None  # selection currently written to picked_contours.kml
+
+# extraction runs on one worker thread (OpenCV/NumPy release the GIL) so the
+# UI keeps responding; the main loop redraws once a result lands
+executor = ThreadPoolExecutor(max_workers=1)
+pending_key = None
+pending_future = None  # latest extraction; cancelled on exit if still queued
+redraw_pending = False
+
+MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+def mask_to_contours(mask):
+    """
+    Trace the outer contours of a uint8 mask as int32 (N, 1, 2) (x, y) arrays.
+    """
+    # close pinholes and 1-px gaps so one feature isn't split into fragments;
+    # no opening, it would erase the 1-2 px lines this tool is used to pick
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_L1)
+    # drop speckle before it reaches drawing and export; perimeter rather than
+    # area, since a 1-px line traces as a zero-area contour
+    return [c for c in contours if cv2.arcLength(c, True) >= min_perimeter]
+
+def compute_contours(key):
+    """
+    Background task: mask and trace the contours for one
+    (bbox, target_rgb, tol, metric) key. Contours are in ROI coordinates.
+    """
+    bbox, target_rgb, tol, metric = key
+    x1, y1, x2, y2 = bbox
+    region = orig[y1:y2, x1:x2]
+    match_gmt_colormap(region)
+    # show_3d_surface(region)
+    # save_surface_as_kml(region, bbox)
+    if metric == "lab":
+        mask = lab_mask(orig_lab[y1:y2, x1:x2], target_rgb, tol)
+    else:
+        mask = color_mask(region, target_rgb, tol, metric)
+    return mask_to_contours(mask)
+
+def on_contours_ready(key, fut):
+    global redraw_pending
+    if fut.cancelled():
+        return
+    if fut.exception() is not None:
+        print(f"[ERROR] Contour extraction failed: {fut.exception()}")
+        return
+    if len(contour_cache) >= CONTOUR_CACHE_SIZE:
+        contour_cache.pop(next(iter(contour_cache)))
+    contour_cache[key] = fut.result()
+    redraw_pending = True
+
+def on_kml_saved(key, fut):
+    global kml_key
+    if fut.cancelled():
+        return
+    if fut.exception() is not None:
+        print(f"[ERROR] KML export failed: {fut.exception()}")
+        # forget the failed selection so the next redraw of it retries the write
+        if kml_key == key:
+            kml_key = None
 
 def extract_and_draw(event=None):
-    global img
-    img = orig.copy()
+    global pending_key, pending_future, kml_key
+    # refill the preallocated canvas in place rather than allocating a new copy
+    np.copyto(img, orig)
     if bbox:
         x1, y1, x2, y2 = bbox
         cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
 
         # Convert pixel coords to lat/lon
-        lon_nw, lat_nw = pixel_to_latlon(x1, y1, img.shape, geo_bounds)
-        lon_se, lat_se = pixel_to_latlon(x2, y2, img.shape, geo_bounds)
+        lon_nw, lat_nw = pixel_to_latlon(x1, y1)
+        lon_se, lat_se = pixel_to_latlon(x2, y2)
 
         # Format labels
         label_nw = f"NW: {lon_nw:.5f}, {lat_nw:.5f}"
         label_se = f"SE: {lon_se:.5f}, {lat_se:.5f}"
 
         # ✅ Use black color for text (0, 0, 0) with larger font and proper placement
-        text_size_nw = cv2.getTextSize(label_nw, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0]
-        text_size_se = cv2.getTextSize(label_se, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)[0]
+        text_size_nw = text_size(label_nw)
+        text_size_se = text_size(label_se)
 
         nw_x = max(x1 + 4, 10)
         nw_y = max(y1 - 20, text_size_nw[1] + 10)
@@ -209,38 +405,77 @@ def extract_and_draw(event=None):
             cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 0), 2, cv2.LINE_AA)
 
     if bbox and target_rgb is not None:
-        
         x1, y1, x2, y2 = bbox
-        region = orig[y1:y2, x1:x2]
-        match_gmt_colormap(region)
-        # show_3d_surface(region)
-        # save_surface_as_kml(region, bbox)
-        dist = np.linalg.norm(region.astype(float) - target_rgb, axis=2)
-        mask = (dist <= tol).astype(np.uint8) * 255
-        contours = measure.find_contours(mask, 0.5)
-        for cnt in contours:
-            pts = np.round(np.fliplr(cnt) + [x1, y1]).astype(int)
-            cv2.polylines(img, [pts], isClosed=True, color=(0, 0, 255), thickness=1)
-            for (px, py) in pts:
-                cv2.circle(img, (px, py), radius=2, color=(0, 0, 255), thickness=-1)
-        save_kml(contours, bbox, filename="picked_contours.kml")
+        key = (bbox, target_rgb, tol, metric)
+        contours = contour_cache.get(key)
+        if contours is None:
+            # draw the box now; contours follow when the worker finishes
+            contours = ()
+            if key != pending_key:
+                pending_key = key
+                pending_future = executor.submit(compute_contours, key)
+                pending_future.add_done_callback(functools.partial(on_contours_ready, key))
+        elif key != kml_key:
+            # export whatever is on screen; queued behind any running extraction
+            kml_key = key
+            fut = executor.submit(save_kml, contours, bbox, "picked_contours.kml")
+            fut.add_done_callback(functools.partial(on_kml_saved, key))
+        if contours:
+            pts = [cnt.reshape(-1, 2) + (x1, y1) for cnt in contours]
+            cv2.polylines(img, pts, isClosed=True, color=(0, 0, 255), thickness=1)
+            # one stamp over every vertex; per-contour calls cost more than cv2.circle
+            draw_dots(img, np.concatenate(pts), (0, 0, 255))
 
     cv2.imshow("Real-Time Contour Extractor", img)
 
 
+def restore_outline(rect, pad=2):
+    """
+    Copy orig back over the border strips of a previously drawn rectangle,
+    instead of re-copying the whole image.
+    """
+    h, w = img.shape[:2]
+    x1, x2 = sorted(rect[0::2])
+    y1, y2 = sorted(rect[1::2])
+
+    def cx(v):
+        return min(max(v, 0), w)
+
+    def cy(v):
+        return min(max(v, 0), h)
+
+    strips = [
+        (cy(y1 - pad), cy(y1 + pad + 1), cx(x1 - pad), cx(x2 + pad + 1)),  # top
+        (cy(y2 - pad), cy(y2 + pad + 1), cx(x1 - pad), cx(x2 + pad + 1)),  # bottom
+        (cy(y1 - pad), cy(y2 + pad + 1), cx(x1 - pad), cx(x1 + pad + 1)),  # left
+        (cy(y1 - pad), cy(y2 + pad + 1), cx(x2 - pad), cx(x2 + pad + 1)),  # right
+    ]
+    for ya, yb, xa, xb in strips:
+        img[ya:yb, xa:xb] = orig[ya:yb, xa:xb]
+
+
 def mouse_cb(event, x, y, flags, param):
-    global ix, iy, drawing, bbox, target_rgb
+    global ix, iy, drawing, bbox, target_rgb, prev_rect, last_drag
     if event == cv2.EVENT_LBUTTONDOWN:
         drawing = True
         ix, iy = x, y
         bbox = None
+        np.copyto(img, orig)
+        prev_rect = None
     elif event == cv2.EVENT_MOUSEMOVE and drawing:
-        # draw temporary rectangle
-        img_temp = orig.copy()
-        cv2.rectangle(img_temp, (ix, iy), (x, y), (0, 255, 0), 2)
-        cv2.imshow("Real-Time Contour Extractor", img_temp)
+        now = time.monotonic()
+        if now - last_drag < DRAG_INTERVAL:
+            return
+        last_drag = now
+        # draw temporary rectangle, only repairing the previous one's pixels
+        if prev_rect:
+            restore_outline(prev_rect)
+        cv2.rectangle(img, (ix, iy), (x, y), (0, 255, 0), 2)
+        prev_rect = (ix, iy, x, y)
+        cv2.imshow("Real-Time Contour Extractor", img)
     elif event == cv2.EVENT_LBUTTONUP:
         drawing = False
+        prev_rect = None
         x1, x2 = sorted([ix, x])
         y1, y2 = sorted([iy, y])
         bbox = (x1, y1, x2, y2)
@@ -249,35 +484,32 @@ def mouse_cb(event, x, y, flags, param):
         if bbox:
             target_rgb = get_avg_rgb(x, y, sz=7)
             print(f"[INFO] Picked RGB: {target_rgb}")
-            # Add colormap matching here:
-            x1, y1, x2, y2 = bbox
-            region = orig[y1:y2, x1:x2]
-            match_gmt_colormap(region)
+            # colormap matching runs inside extract_and_draw on a cache miss
             extract_and_draw()
 
 
-from pathlib import Path
+KML_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+KML_LINE_STYLE = ("<Style><LineStyle><color>ff0000ff</color><width>2</width></LineStyle></Style>\n"
+                  "<LineString><tessellate>1</tessellate><coordinates>\n")
+KML_PLACEMARK_END = "\n</coordinates></LineString></Placemark>\n"
+KML_FOOTER = "</Document></kml>"
+KML_COORD = "%f,%f,0"
 
 def save_kml(contours, bbox, filename="picked_contours.kml"):
     x1, y1, x2, y2 = bbox
-    kml = ['<?xml version="1.0" encoding="UTF-8"?>',
-           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>']
-    for i, cnt in enumerate(contours):
-        pts = np.round(np.fliplr(cnt) + [x1, y1]).astype(int)
-        coords = [
-            f"{lon},{lat},0"
-            for px, py in pts
-            for lon, lat in [pixel_to_latlon(px, py, orig.shape, geo_bounds)]
-        ]
-        kml += [
-            f"<Placemark><name>feature_{i}</name>",
-            "<Style><LineStyle><color>ff0000ff</color><width>2</width></LineStyle></Style>",
-            "<LineString><tessellate>1</tessellate><coordinates>",
-            " ".join(coords),
-            "</coordinates></LineString></Placemark>"
-        ]
-    kml.append("</Document></kml>")
-    Path(filename).write_text("\n".join(kml))
+    # stream placemarks straight to disk instead of joining one big string
+    with open(filename, "w", buffering=1 << 20) as f:
+        f.write(KML_HEADER)
+        for i, cnt in enumerate(contours):
+            pts = cnt.reshape(-1, 2) + (x1, y1)
+            lonlat = np.column_stack(pixels_to_latlon(pts)).ravel().tolist()
+            f.write(f"<Placemark><name>feature_{i}</name>\n")
+            f.write(KML_LINE_STYLE)
+            # one %-format call over a repeated template formats every vertex in C
+            f.write(" ".join([KML_COORD] * len(pts)) % tuple(lonlat))
+            f.write(KML_PLACEMARK_END)
+        f.write(KML_FOOTER)
     print(f"[✔] Saved Geo-referenced KML → {filename}")
 
 
@@ -296,5 +528,12 @@ while True:
     key = cv2.waitKey(1) & 0xFF
     if key == 27:  # ESC
         break
+    if redraw_pending:
+        redraw_pending = False
+        extract_and_draw()
 
+# drop a queued extraction nobody will see, but let KML exports finish
+if pending_future is not None:
+    pending_future.cancel()
+executor.shutdown()
 cv2.destroyAllWindows()